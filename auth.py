@@ -1,12 +1,12 @@
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, Set
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from config import settings
 from database import db
-from models import User, TokenData
+from models import User, TokenData, AuthContext
 
 # Password hashing
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -37,8 +37,12 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return encoded_jwt
 
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> User:
-    """Get current authenticated user"""
+async def get_auth_context(credentials: HTTPAuthorizationCredentials = Depends(security)) -> AuthContext:
+    """Get the authenticated user and their active event ids in one database round trip.
+
+    FastAPI caches dependencies per request, so get_current_user and
+    get_user_event_ids share this single lookup.
+    """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -54,13 +58,20 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
     except JWTError:
         raise credentials_exception
     
-    user_data = await db.get_user_profile(token_data.user_id)
+    user_data = await db.get_user_profile_with_event_ids(token_data.user_id)
     if user_data is None:
         raise credentials_exception
     
-    # Convert to User model
-    user = User(**user_data)
-    return user
+    memberships = user_data.pop("user_events", None) or []
+    return AuthContext(
+        user=User(**user_data),
+        event_ids={membership["event_id"] for membership in memberships}
+    )
+
+
+async def get_current_user(auth: AuthContext = Depends(get_auth_context)) -> User:
+    """Get current authenticated user"""
+    return auth.user
 
 
 async def get_current_active_user(current_user: User = Depends(get_current_user)) -> User:
@@ -70,6 +81,14 @@ async def get_current_active_user(current_user: User = Depends(get_current_user)
     return current_user
 
 
+async def get_user_event_ids(
+    current_user: User = Depends(get_current_active_user),
+    auth: AuthContext = Depends(get_auth_context)
+) -> Set[str]:
+    """Get the ids of the current active user's events (no extra query)"""
+    return auth.event_ids
+
+
 async def authenticate_user_credentials(email: str, password: str) -> Optional[User]:
     """Authenticate user with email and password"""
     import logging
@@ -25,6 +25,9 @@ class Settings(BaseSettings):
     
     fcm_server_key: Optional[str] = None
     
+    # Redis backplane for video signaling across workers (in-process when unset)
+    redis_url: Optional[str] = None
+    
     class Config:
         env_file = ".env"
         case_sensitive = False
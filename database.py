@@ -1,8 +1,20 @@
 from supabase import create_client, Client
 from config import settings
 import asyncio
-from typing import Optional, Dict, Any, List
-from datetime import datetime
+import time
+from typing import Optional, Dict, Any, List, Set, Tuple
+from datetime import datetime, timezone
+
+# Short-lived in-process cache for profile rows read in bulk (video call participants)
+PROFILE_CACHE_TTL_SECONDS = 30
+PROFILE_CACHE_MAX_ENTRIES = 10000
+
+# EventPinWithCreator columns; pin reads are serialized without response_model filtering
+_PIN_WITH_CREATOR_COLUMNS = (
+    "id, event_id, creator_id, title, description, latitude, longitude, pin_type, "
+    "color, icon, is_public, created_at, updated_at, "
+    "creator:creator_id (id, full_name, avatar_url)"
+)
 
 
 class SupabaseClient:
@@ -12,6 +24,7 @@ class SupabaseClient:
             settings.supabase_url,
             settings.supabase_key
         )
+        self._profile_cache: Dict[str, Tuple[float, Dict[str, Any]]] = {}  # user_id -> (monotonic expiry, profile)
     
     async def create_user(self, email: str, password: str, user_data: Dict[str, Any]) -> Dict[str, Any]:
         """Create a new user with Supabase Auth"""
@@ -126,12 +139,61 @@ class SupabaseClient:
             print(f"Error fetching user profile: {e}")
             return None
 
+    async def get_existing_user_ids(self, user_ids: List[str]) -> Set[str]:
+        """Return which of the given user ids have a profile (id-only query)"""
+        if not user_ids:
+            return set()
+        try:
+            response = self.client.table("profiles").select("id").in_("id", list(user_ids)).execute()
+            return {row["id"] for row in response.data or []}
+        except Exception as e:
+            print(f"Error checking user ids: {e}")
+            return set()
+
+    async def get_user_profile_with_event_ids(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """Get user profile with their active event memberships embedded (one query)"""
+        try:
+            response = self.client.table("profiles").select("*, user_events(event_id)").eq("id", user_id).eq("user_events.is_active", True).execute()
+            return response.data[0] if response.data else None
+        except Exception as e:
+            print(f"Error fetching user profile with events: {e}")
+            return None
+
+    async def get_user_profiles_bulk(self, user_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Get several user profiles keyed by user id, serving recent reads from cache"""
+        now = time.monotonic()
+        profiles: Dict[str, Dict[str, Any]] = {}
+        missing: List[str] = []
+        for user_id in user_ids:
+            cached = self._profile_cache.get(user_id)
+            if cached is not None and cached[0] > now:
+                profiles[user_id] = cached[1]
+            else:
+                missing.append(user_id)
+        
+        if not missing:
+            return profiles
+        try:
+            response = self.client.table("profiles").select("*").in_("id", missing).execute()
+            expiry = now + PROFILE_CACHE_TTL_SECONDS
+            for profile in response.data or []:
+                profiles[profile["id"]] = profile
+                self._profile_cache.pop(profile["id"], None)
+                if len(self._profile_cache) >= PROFILE_CACHE_MAX_ENTRIES:
+                    # Evict the least recently stored entry
+                    self._profile_cache.pop(next(iter(self._profile_cache)))
+                self._profile_cache[profile["id"]] = (expiry, profile)
+        except Exception as e:
+            print(f"Error fetching user profiles: {e}")
+        return profiles
+
     async def ensure_user_profile(self, user: Any) -> Optional[Dict[str, Any]]:
         """Ensure a profile row exists for the given Supabase auth user.
 
         If the row exists, update it from user metadata; otherwise, insert it.
         Returns the ensured row.
         """
+        self._profile_cache.pop(user.id, None)
         try:
             print(f"🔧 Ensuring profile for user: {user.id}")
             profile_payload: Dict[str, Any] = {
@@ -181,6 +243,7 @@ class SupabaseClient:
     
     async def update_user_profile(self, user_id: str, updates: Dict[str, Any]) -> bool:
         """Update user profile"""
+        self._profile_cache.pop(user_id, None)
         try:
             self.client.table("profiles").update(updates).eq("id", user_id).execute()
             return True
@@ -206,6 +269,15 @@ class SupabaseClient:
             print(f"Error fetching event: {e}")
             return None
     
+    async def get_event_creator(self, event_id: str) -> Optional[str]:
+        """Get only the creator_id of an event (for permission checks)"""
+        try:
+            response = self.client.table("events").select("creator_id").eq("id", event_id).maybe_single().execute()
+            return response.data.get("creator_id") if response and response.data else None
+        except Exception as e:
+            print(f"Error fetching event creator: {e}")
+            return None
+    
     async def get_user_events(self, user_id: str) -> List[Dict[str, Any]]:
         """Get all events for a user with accurate participant counts"""
         try:
@@ -245,6 +317,17 @@ class SupabaseClient:
             print(f"Error fetching user events: {e}")
             return []
     
+    async def shares_active_event(self, user_id: str, event_ids: Set[str]) -> bool:
+        """Check whether a user is an active participant of any of the given events (single-row lookup)"""
+        if not event_ids:
+            return False
+        try:
+            response = self.client.table("user_events").select("event_id").eq("user_id", user_id).in_("event_id", list(event_ids)).eq("is_active", True).limit(1).execute()
+            return bool(response.data)
+        except Exception as e:
+            print(f"Error checking shared events: {e}")
+            return False
+    
     async def join_event(self, user_id: str, event_id: str, role: str = "participant") -> bool:
         """Add user to event"""
         try:
@@ -333,10 +416,11 @@ class SupabaseClient:
                 print(f"Fallback direct messages query also failed: {fallback_error}")
                 return []
     
-    async def update_user_location(self, user_id: str, location_data: Dict[str, Any]) -> bool:
-        """Update user's current location using UPSERT approach"""
+    async def update_user_location(self, user_id: str, location_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Update user's current location using UPSERT approach; returns the stored row"""
         try:
-            # Use UPSERT to update existing record or create new one
+            now_iso = datetime.now(timezone.utc).isoformat()
+            # Use UPSERT to update existing record or create new one (row comes back in the same call)
             response = self.client.table("user_current_locations").upsert({
                 "user_id": user_id,
                 "latitude": location_data["latitude"],
@@ -344,14 +428,14 @@ class SupabaseClient:
                 "accuracy": location_data.get("accuracy"),
                 "heading": location_data.get("heading"),
                 "speed": location_data.get("speed"),
-                "timestamp": location_data.get("timestamp", datetime.utcnow().isoformat()),
-                "updated_at": datetime.utcnow().isoformat()
-            }).execute()
+                "timestamp": location_data.get("timestamp", now_iso),
+                "updated_at": now_iso
+            }, on_conflict="user_id").execute()
             
-            return True
+            return response.data[0] if response.data else None
         except Exception as e:
             print(f"Error updating location: {e}")
-            return False
+            return None
     
     async def get_user_current_location(self, user_id: str) -> Optional[Dict[str, Any]]:
         """Get user's current location"""
@@ -392,7 +476,7 @@ class SupabaseClient:
         try:
             self.client.table("user_current_locations").update({
                 "is_shared": is_shared,
-                "updated_at": datetime.utcnow().isoformat()
+                "updated_at": datetime.now(timezone.utc).isoformat()
             }).eq("user_id", user_id).execute()
             
             return True
@@ -413,7 +497,7 @@ class SupabaseClient:
                 return []
 
             # 2) Fetch profiles in batch
-            profiles_resp = self.client.table("profiles").select("id, email, full_name, avatar_url, phone_number, role, is_active, created_at, updated_at").in_(
+            profiles_resp = self.client.table("profiles").select("id, email, full_name, avatar_url, phone_number, role, is_active, last_seen, created_at, updated_at").in_(
                 "id", user_ids
             ).execute()
             id_to_profile: Dict[str, Dict[str, Any]] = {p["id"]: p for p in (profiles_resp.data or [])}
@@ -493,14 +577,33 @@ class SupabaseClient:
             return False
     
     # Event Invitations
-    async def create_event_invitation(self, invitation_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
-        """Create an event invitation"""
+    async def create_event_invitation(self, invitation_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Create an event invitation unless one already exists for the invitee.
+
+        Relies on the UNIQUE(event_id, invitee_id) constraint: a conflicting
+        insert is ignored by the database and returns no row.
+        """
         try:
-            response = self.client.table("event_invitations").insert(invitation_data).execute()
-            return response.data[0] if response.data else None
+            response = self.client.table("event_invitations").upsert(
+                invitation_data,
+                on_conflict="event_id,invitee_id",
+                ignore_duplicates=True
+            ).execute()
+            if response.data:
+                return {
+                    "success": True,
+                    "invitation": response.data[0]
+                }
+            return {
+                "success": False,
+                "message": "Invitation already sent to this user"
+            }
         except Exception as e:
             print(f"Error creating event invitation: {e}")
-            return None
+            return {
+                "success": False,
+                "message": "Failed to create invitation"
+            }
     
     async def get_event_invitations(self, event_id: str) -> List[Dict[str, Any]]:
         """Get all invitations for an event with full user data for inviter and invitee"""
@@ -709,6 +812,54 @@ class SupabaseClient:
             print(f"Error updating video call: {e}")
             return False
     
+    async def add_video_call_participant(self, call_id: str, user_id: str) -> bool:
+        """Atomically append a user to a video call's participants (no-op if already present)"""
+        try:
+            self.client.rpc("add_video_call_participant", {
+                "p_call_id": call_id,
+                "p_user_id": user_id
+            }).execute()
+            return True
+        except Exception as e:
+            print(f"Error adding video call participant: {e}")
+            return False
+    
+    async def join_video_call(self, call_id: str, user_id: str) -> Optional[Dict[str, Any]]:
+        """Atomically add a user to an active video call; returns the call row, or None if not found"""
+        try:
+            response = self.client.rpc("join_video_call", {
+                "p_call_id": call_id,
+                "p_user_id": user_id
+            }).execute()
+            return response.data[0] if response.data else None
+        except Exception as e:
+            print(f"Error joining video call: {e}")
+            return None
+    
+    async def leave_video_call(self, call_id: str, user_id: str) -> Optional[Dict[str, Any]]:
+        """Atomically remove a user from a video call; returns the call row, or None if not found"""
+        try:
+            response = self.client.rpc("leave_video_call", {
+                "p_call_id": call_id,
+                "p_user_id": user_id
+            }).execute()
+            return response.data[0] if response.data else None
+        except Exception as e:
+            print(f"Error leaving video call: {e}")
+            return None
+    
+    async def end_video_call(self, call_id: str, creator_id: str) -> Optional[Dict[str, Any]]:
+        """Mark a video call ended if owned by creator_id; returns the updated row, or None"""
+        try:
+            response = self.client.table("video_calls").update({
+                "is_active": False,
+                "ended_at": datetime.now(timezone.utc).isoformat()
+            }).eq("id", call_id).eq("creator_id", creator_id).execute()
+            return response.data[0] if response.data else None
+        except Exception as e:
+            print(f"Error ending video call: {e}")
+            return None
+    
     async def get_user_active_calls(self, user_id: str) -> List[Dict[str, Any]]:
         """Get active video calls for a user"""
         try:
@@ -733,10 +884,7 @@ class SupabaseClient:
     async def get_event_pins(self, event_id: str) -> List[Dict[str, Any]]:
         """Get all pins for an event"""
         try:
-            response = self.client.table("event_pins").select("""
-                *,
-                creator:creator_id (id, full_name, avatar_url)
-            """).eq("event_id", event_id).order("created_at", desc=False).execute()
+            response = self.client.table("event_pins").select(_PIN_WITH_CREATOR_COLUMNS).eq("event_id", event_id).order("created_at", desc=False).execute()
             return response.data or []
         except Exception as e:
             print(f"Error fetching event pins: {e}")
@@ -745,26 +893,26 @@ class SupabaseClient:
     async def get_event_pin(self, pin_id: str) -> Optional[Dict[str, Any]]:
         """Get a specific event pin"""
         try:
-            response = self.client.table("event_pins").select("""
-                *,
-                creator:creator_id (id, full_name, avatar_url)
-            """).eq("id", pin_id).single().execute()
+            response = self.client.table("event_pins").select(_PIN_WITH_CREATOR_COLUMNS).eq("id", pin_id).single().execute()
             return response.data if response.data else None
         except Exception as e:
             print(f"Error fetching event pin: {e}")
             return None
     
-    async def update_event_pin(self, pin_id: str, updates: Dict[str, Any]) -> bool:
-        """Update an event pin"""
+    async def update_event_pin(self, pin_id: str, updates: Dict[str, Any], creator_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Update an event pin (optionally only if owned by creator_id); returns the updated row"""
         try:
             # Add updated_at timestamp
-            updates["updated_at"] = datetime.utcnow().isoformat()
+            updates["updated_at"] = datetime.now(timezone.utc).isoformat()
             
-            self.client.table("event_pins").update(updates).eq("id", pin_id).execute()
-            return True
+            query = self.client.table("event_pins").update(updates).eq("id", pin_id)
+            if creator_id is not None:
+                query = query.eq("creator_id", creator_id)
+            response = query.execute()
+            return response.data[0] if response.data else None
         except Exception as e:
             print(f"Error updating event pin: {e}")
-            return False
+            return None
     
     async def delete_event_pin(self, pin_id: str) -> bool:
         """Delete an event pin"""
@@ -778,10 +926,7 @@ class SupabaseClient:
     async def get_pins_by_type(self, event_id: str, pin_type: str) -> List[Dict[str, Any]]:
         """Get pins of a specific type for an event"""
         try:
-            response = self.client.table("event_pins").select("""
-                *,
-                creator:creator_id (id, full_name, avatar_url)
-            """).eq("event_id", event_id).eq("pin_type", pin_type).order("created_at", desc=False).execute()
+            response = self.client.table("event_pins").select(_PIN_WITH_CREATOR_COLUMNS).eq("event_id", event_id).eq("pin_type", pin_type).order("created_at", desc=False).execute()
             return response.data or []
         except Exception as e:
             print(f"Error fetching pins by type: {e}")
@@ -790,10 +935,7 @@ class SupabaseClient:
     async def get_pins_in_bounds(self, event_id: str, north: float, south: float, east: float, west: float) -> List[Dict[str, Any]]:
         """Get pins within geographic bounds"""
         try:
-            response = self.client.table("event_pins").select("""
-                *,
-                creator:creator_id (id, full_name, avatar_url)
-            """).eq("event_id", event_id).gte("latitude", south).lte("latitude", north).gte("longitude", west).lte("longitude", east).execute()
+            response = self.client.table("event_pins").select(_PIN_WITH_CREATOR_COLUMNS).eq("event_id", event_id).gte("latitude", south).lte("latitude", north).gte("longitude", west).lte("longitude", east).execute()
             return response.data or []
         except Exception as e:
             print(f"Error fetching pins in bounds: {e}")
@@ -803,10 +945,7 @@ class SupabaseClient:
         """Search pins by title and description"""
         try:
             # Search in title and description fields
-            response = self.client.table("event_pins").select("""
-                *,
-                creator:creator_id (id, full_name, avatar_url)
-            """).eq("event_id", event_id).or_(f"title.ilike.%{query}%,description.ilike.%{query}%").execute()
+            response = self.client.table("event_pins").select(_PIN_WITH_CREATOR_COLUMNS).eq("event_id", event_id).or_(f"title.ilike.%{query}%,description.ilike.%{query}%").execute()
             return response.data or []
         except Exception as e:
             return []
@@ -829,7 +968,7 @@ class SupabaseClient:
                     "participants": [creator_id],
                     "is_group_call": True,
                     "is_active": True,
-                    "started_at": datetime.utcnow().isoformat()
+                    "started_at": datetime.now(timezone.utc).isoformat()
                 }
                 return await self.create_video_call(video_call_data)
         except Exception as e:
@@ -850,7 +989,7 @@ class SupabaseClient:
                     "device_type": device_type,
                     "device_name": device_name,
                     "is_active": True,
-                    "updated_at": datetime.utcnow().isoformat()
+                    "updated_at": datetime.now(timezone.utc).isoformat()
                 }).eq("token", token).execute()
             else:
                 # Insert new token
@@ -872,7 +1011,7 @@ class SupabaseClient:
         try:
             self.client.table("user_device_tokens").update({
                 "is_active": False,
-                "updated_at": datetime.utcnow().isoformat()
+                "updated_at": datetime.now(timezone.utc).isoformat()
             }).eq("user_id", user_id).eq("token", token).execute()
             
             return True
@@ -194,6 +194,7 @@ CREATE INDEX IF NOT EXISTS idx_video_calls_active ON video_calls(is_active);
 CREATE INDEX IF NOT EXISTS idx_event_pins_event_id ON event_pins(event_id);
 CREATE INDEX IF NOT EXISTS idx_event_pins_creator_id ON event_pins(creator_id);
 CREATE INDEX IF NOT EXISTS idx_event_pins_location ON event_pins(latitude, longitude);
+CREATE INDEX IF NOT EXISTS idx_event_pins_event_location ON event_pins(event_id, latitude, longitude);
 CREATE INDEX IF NOT EXISTS idx_event_pins_pin_type ON event_pins(pin_type);
 
 -- Row Level Security (RLS) Policies
@@ -444,6 +445,38 @@ CREATE TRIGGER on_auth_user_created
     AFTER INSERT ON auth.users
     FOR EACH ROW EXECUTE PROCEDURE handle_new_user();
 
+-- Function to add a participant to a video call atomically (no read-modify-write)
+CREATE OR REPLACE FUNCTION add_video_call_participant(p_call_id UUID, p_user_id UUID)
+RETURNS SETOF video_calls AS $$
+    UPDATE video_calls
+    SET participants = array_append(participants, p_user_id)
+    WHERE id = p_call_id
+    AND NOT (p_user_id = ANY(participants))
+    RETURNING *;
+$$ LANGUAGE sql;
+
+-- Function to join a video call in one statement; returns the call row (if it exists)
+-- so callers can tell "not found" from "not active" without a separate read
+CREATE OR REPLACE FUNCTION join_video_call(p_call_id UUID, p_user_id UUID)
+RETURNS SETOF video_calls AS $$
+    UPDATE video_calls
+    SET participants = CASE
+        WHEN is_active AND NOT (p_user_id = ANY(participants)) THEN array_append(participants, p_user_id)
+        ELSE participants
+    END
+    WHERE id = p_call_id
+    RETURNING *;
+$$ LANGUAGE sql;
+
+-- Function to leave a video call in one statement; returns the call row (if it exists)
+CREATE OR REPLACE FUNCTION leave_video_call(p_call_id UUID, p_user_id UUID)
+RETURNS SETOF video_calls AS $$
+    UPDATE video_calls
+    SET participants = array_remove(participants, p_user_id)
+    WHERE id = p_call_id
+    RETURNING *;
+$$ LANGUAGE sql;
+
 -- Function to update participant count
 CREATE OR REPLACE FUNCTION update_event_participant_count()
 RETURNS TRIGGER AS $$
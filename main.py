@@ -4,6 +4,7 @@ from fastapi.middleware.trustedhost import TrustedHostMiddleware
 from fastapi.responses import JSONResponse
 import logging
 from config import settings
+from responses import ORJSONResponse
 from routers import (
     auth_router,
     events_router,
@@ -17,8 +18,8 @@ from routers import (
     notifications_router
 )
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# Configure logging (quieter in production; hot-path debug logs are skipped)
+logging.basicConfig(level=logging.INFO if settings.debug else logging.WARNING)
 logger = logging.getLogger(__name__)
 
 # Create FastAPI app
@@ -28,6 +29,7 @@ app = FastAPI(
     description="Conduit - A social event and location sharing app like Life 360 with a social twist",
     docs_url="/docs" if settings.debug else None,
     redoc_url="/redoc" if settings.debug else None,
+    default_response_class=ORJSONResponse,
 )
 
 # Add middleware
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, EmailStr, Field, validator
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Set
 from datetime import datetime
 from enum import Enum
 
@@ -51,6 +51,19 @@ class User(UserBase):
         from_attributes = True
 
 
+# Fallbacks for User fields missing from partial profile joins (id, full_name, avatar_url),
+# merged in before message senders and pin creators are serialized
+JOINED_USER_DEFAULTS: Dict[str, Any] = {
+    "email": "unknown@example.com",
+    "full_name": "Unknown User",
+    "role": "user",
+    "is_active": True,
+    "last_seen": None,
+    "created_at": "2024-01-01T00:00:00Z",
+    "updated_at": None,
+}
+
+
 class LocationData(BaseModel):
     latitude: float = Field(..., ge=-90, le=90)
     longitude: float = Field(..., ge=-180, le=180)
@@ -247,6 +260,12 @@ class TokenData(BaseModel):
     user_id: Optional[str] = None
 
 
+class AuthContext(BaseModel):
+    """Authenticated user plus the ids of their active events, loaded together"""
+    user: User
+    event_ids: Set[str] = set()
+
+
 # Response models
 class EventWithParticipants(Event):
     participants: List[User] = []
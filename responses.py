@@ -0,0 +1,34 @@
+"""
+orjson-backed JSON response (the app-wide default response class) and WebSocket frame encoding.
+"""
+
+from typing import Any
+import orjson
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+
+def _default(obj: Any) -> Any:
+    """Serialize types orjson doesn't handle natively (datetime and UUID already are)"""
+    if isinstance(obj, BaseModel):
+        return obj.model_dump()
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def dumps_text(obj: Any) -> str:
+    """Serialize a WebSocket payload with orjson, decoded for text frames"""
+    return orjson.dumps(obj, default=str).decode()
+
+
+class ORJSONResponse(JSONResponse):
+    """JSON response rendered with orjson, bypassing jsonable_encoder.
+
+    Return it directly from an endpoint (with ``response_class=ORJSONResponse``)
+    so FastAPI skips response_model validation and encoding.
+    """
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NAIVE_UTC)
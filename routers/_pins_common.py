@@ -0,0 +1,36 @@
+"""
+Shared helpers for the event pin endpoints.
+"""
+
+from typing import Any, Dict, List, Set
+from fastapi import HTTPException, status
+from models import JOINED_USER_DEFAULTS
+from responses import ORJSONResponse
+
+
+def require_event_participant(event_id: str, user_event_ids: Set[str]):
+    """Raise 403 unless the event is one of the current user's events"""
+    if event_id not in user_event_ids:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Access denied: not a participant in this event"
+        )
+
+
+def merge_creator(pin_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Fill the joined creator row on a pin with the User defaults (or None)"""
+    creator_data = pin_data.get("creator")
+    pin_data["creator"] = JOINED_USER_DEFAULTS | creator_data if creator_data else None
+    return pin_data
+
+
+def pin_list_response(pins_data: List[Dict[str, Any]]) -> ORJSONResponse:
+    """Serialize joined pin rows as a List[EventPinWithCreator] response.
+
+    Rows come from our own database with the EventPin columns, so they are
+    handed to orjson as-is instead of being validated into models.
+    """
+    pin_data: Dict[str, Any]
+    for pin_data in pins_data:
+        merge_creator(pin_data)
+    return ORJSONResponse(content=pins_data)
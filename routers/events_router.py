@@ -1,4 +1,5 @@
 from typing import List
+from pydantic import TypeAdapter, ValidationError
 from fastapi import APIRouter, Depends, HTTPException, status, Query
 from models import (
     Event, EventCreate, EventUpdate, EventWithParticipants,
@@ -6,11 +7,14 @@ from models import (
 )
 from auth import get_current_active_user
 from database import db
+from routers.messaging_router import manager as messaging_manager
 import uuid
 from datetime import datetime
 
 router = APIRouter(prefix="/events", tags=["events"])
 
+_EVENT_LIST = TypeAdapter(List[Event])
+
 
 @router.post("/", response_model=Event)
 async def create_event(
@@ -18,18 +22,9 @@ async def create_event(
     current_user: User = Depends(get_current_active_user)
 ):
     """Create a new event"""
-    # Prepare event data with proper datetime serialization
-    event_dict = event_data.dict()
-    
-    # Convert datetime fields to ISO format strings
-    if event_dict.get("start_date"):
-        event_dict["start_date"] = event_dict["start_date"].isoformat()
-    if event_dict.get("end_date"):
-        event_dict["end_date"] = event_dict["end_date"].isoformat()
-    
-    # Convert location_coords to dict if it's a Pydantic model
-    if event_dict.get("location_coords") and hasattr(event_dict["location_coords"], "dict"):
-        event_dict["location_coords"] = event_dict["location_coords"].dict()
+    # Prepare event data; JSON mode serializes datetimes (including nested
+    # location_coords.timestamp) to ISO strings in one pass
+    event_dict = event_data.model_dump(mode="json")
     
     event_dict.update({
         "id": str(uuid.uuid4()),
@@ -47,7 +42,8 @@ async def create_event(
             detail="Failed to create event"
         )
     
-    # Add creator as participant
+    # Add creator as participant before responding so follow-up calls for the
+    # new event (pins, messages, video, GET /events/) already see the membership
     await db.join_event(current_user.id, created_event["id"], "creator")
     
     # Note: Video call will be created on-demand when first user joins
@@ -62,14 +58,15 @@ async def get_user_events(
     """Get all events for the current user"""
     user_events = await db.get_user_events(current_user.id)
     
-    events = []
-    for event_data in user_events:
-        try:
-            events.append(Event(**event_data))
-        except Exception as e:
-            print(f"Error creating Event object: {e}")
-            print(f"Event data: {event_data}")
-    return events
+    # Validate the whole list in one pass; skip only the rows that fail
+    try:
+        return _EVENT_LIST.validate_python(user_events)
+    except ValidationError as e:
+        bad_rows = {err["loc"][0] for err in e.errors() if err["loc"]}
+        print(f"Skipping invalid event rows {sorted(bad_rows)}: {e}")
+        return _EVENT_LIST.validate_python(
+            [event_data for i, event_data in enumerate(user_events) if i not in bad_rows]
+        )
 
 
 @router.get("/{event_id}", response_model=EventWithParticipants)
@@ -121,15 +118,15 @@ async def update_event(
     current_user: User = Depends(get_current_active_user)
 ):
     """Update an event (only creator or admin can update)"""
-    # Check if event exists and user has permission
-    event_data = await db.get_event(event_id)
-    if not event_data:
+    # Check if event exists and user has permission (creator_id only)
+    creator_id = await db.get_event_creator(event_id)
+    if not creator_id:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Event not found"
         )
     
-    if event_data["creator_id"] != current_user.id:
+    if creator_id != current_user.id:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Only event creator can update event"
@@ -142,6 +139,14 @@ async def update_event(
         # Note: Implement update logic in database.py
         # For now, we'll just return the original event
     
+    # Full row is only needed for the response body
+    event_data = await db.get_event(event_id)
+    if not event_data:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Event not found"
+        )
+    
     return Event(**event_data)
 
 
@@ -175,6 +180,7 @@ async def join_event(
     # Join event
     success = await db.join_event(current_user.id, event_id)
     if success:
+        messaging_manager.invalidate_event(event_id)
         # Also add user to the video call for this event
         try:
             # Get the video call for this event
@@ -240,6 +246,7 @@ async def leave_event(
     # Leave event
     success = await db.leave_event(current_user.id, event_id)
     if success:
+        messaging_manager.invalidate_event(event_id)
         # Also remove user from the video call for this event
         try:
             # Get the video call for this event
@@ -318,6 +325,7 @@ async def remove_participant(
     success = await db.leave_event(user_id, event_id)
     
     if success:
+        messaging_manager.invalidate_event(event_id)
         return {
             "success": True,
             "message": f"User {user_id} removed from event successfully"
@@ -335,15 +343,15 @@ async def delete_event(
     current_user: User = Depends(get_current_active_user)
 ):
     """Delete an event (only creator can delete)"""
-    # Check if event exists and user has permission
-    event_data = await db.get_event(event_id)
-    if not event_data:
+    # Check if event exists and user has permission (creator_id only)
+    creator_id = await db.get_event_creator(event_id)
+    if not creator_id:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Event not found"
         )
     
-    if event_data["creator_id"] != current_user.id:
+    if creator_id != current_user.id:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Only event creator can delete event"
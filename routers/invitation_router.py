@@ -6,6 +6,7 @@ from models import (
 )
 from auth import get_current_active_user
 from database import db
+from routers.messaging_router import manager as messaging_manager
 import uuid
 from datetime import datetime
 
@@ -44,20 +45,7 @@ async def create_invitation(
             detail="User is already a participant in this event"
         )
     
-    # Check if invitation already exists
-    existing_invitations = await db.get_event_invitations(invitation_data.event_id)
-    existing_invitation = any(
-        inv.get("invitee_id") == invitation_data.invitee_id and inv.get("status") == "pending"
-        for inv in existing_invitations
-    )
-    
-    if existing_invitation:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Invitation already sent to this user"
-        )
-    
-    # Create invitation
+    # Create invitation (duplicates are rejected by the DB unique constraint)
     invitation_dict = invitation_data.dict()
     invitation_dict.update({
         "id": str(uuid.uuid4()),
@@ -66,14 +54,14 @@ async def create_invitation(
         "created_at": datetime.utcnow().isoformat()
     })
     
-    created_invitation = await db.create_event_invitation(invitation_dict)
-    if not created_invitation:
+    result = await db.create_event_invitation(invitation_dict)
+    if not result["success"]:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Failed to create invitation"
+            detail=result["message"]
         )
     
-    return EventInvitation(**created_invitation)
+    return EventInvitation(**result["invitation"])
 
 
 @router.get("/event/{event_id}", response_model=List[EventInvitation])
@@ -142,7 +130,7 @@ async def respond_to_invitation(
     if response_data.response == "accepted":
         try:
             # Get the invitation to find the event_id
-            invitation = (await db.client.table("event_invitations")
+            invitation = (db.client.table("event_invitations")
                             .select("event_id")
                             .eq("id", response_data.invitation_id)
                             .single()
@@ -150,15 +138,13 @@ async def respond_to_invitation(
             
             if invitation:
                 event_id = invitation["event_id"]
+                messaging_manager.invalidate_event(event_id)
                 # Get the video call for this event
                 try:
-                    response = db.client.table("video_calls").select("*").eq("event_id", event_id).eq("is_active", True).limit(1).execute()
+                    response = db.client.table("video_calls").select("id").eq("event_id", event_id).eq("is_active", True).limit(1).execute()
                     if response.data:
                         event_video_call = response.data[0]
-                        participants = event_video_call.get("participants", [])
-                        if current_user.id not in participants:
-                            participants.append(current_user.id)
-                        await db.update_video_call(event_video_call["id"], {"participants": participants})
+                        await db.add_video_call_participant(event_video_call["id"], current_user.id)
                 except Exception as e:
                     print(f"Error adding user to video call after invitation acceptance: {e}")
         except Exception as e:
@@ -1,10 +1,13 @@
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Set
 from fastapi import APIRouter, Depends, HTTPException, status, Query
-from models import UserLocation, UserLocationCreate, User, UserCurrentLocation
-from auth import get_current_active_user
+from fastapi.responses import Response
+from models import UserLocationCreate, User, UserCurrentLocation
+from auth import get_current_active_user, get_user_event_ids
 from database import db
+from responses import ORJSONResponse
+import orjson
 import uuid
-from datetime import datetime
+from datetime import datetime, timezone
 from pydantic import BaseModel
 
 router = APIRouter(prefix="/location", tags=["location"])
@@ -14,7 +17,11 @@ class LocationSharingRequest(BaseModel):
     is_shared: bool
 
 
-@router.post("/update", response_model=UserCurrentLocation)
+# Both possible /sharing payloads, serialized once at import
+_SHARING_BODY = {flag: orjson.dumps({"is_shared": flag}) for flag in (True, False)}
+
+
+@router.post("/update", response_class=ORJSONResponse, responses={200: {"model": UserCurrentLocation}})
 async def update_location(
     location_data: UserLocationCreate,
     current_user: User = Depends(get_current_active_user)
@@ -24,29 +31,21 @@ async def update_location(
     location_dict = location_data.dict()
     location_dict.update({
         "user_id": current_user.id,
-        "timestamp": datetime.utcnow().isoformat()
+        "timestamp": datetime.now(timezone.utc).isoformat()
     })
     
-    # Update location in database using UPSERT
-    success = await db.update_user_location(current_user.id, location_dict)
-    if not success:
+    # Update location in database using UPSERT (returns the stored row)
+    updated_location = await db.update_user_location(current_user.id, location_dict)
+    if not updated_location:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Failed to update location"
         )
     
-    # Get the updated location from database to return proper response
-    updated_location = await db.get_user_current_location(current_user.id)
-    if not updated_location:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Failed to retrieve updated location"
-        )
-    
-    return UserCurrentLocation(**updated_location)
+    return ORJSONResponse(content=updated_location)
 
 
-@router.get("/me", response_model=UserCurrentLocation)
+@router.get("/me", response_class=ORJSONResponse, responses={200: {"model": UserCurrentLocation}})
 async def get_my_location(
     current_user: User = Depends(get_current_active_user)
 ):
@@ -58,10 +57,12 @@ async def get_my_location(
             detail="Location not found"
         )
     
-    return UserCurrentLocation(**location)
+    # The row carries the joined user profile, which UserCurrentLocation doesn't include
+    location.pop("user", None)
+    return ORJSONResponse(content=location)
 
 
-@router.post("/sharing")
+@router.post("/sharing", response_class=ORJSONResponse, responses={200: {"model": LocationSharingRequest}})
 async def toggle_location_sharing(
     request: LocationSharingRequest,
     current_user: User = Depends(get_current_active_user)
@@ -74,53 +75,29 @@ async def toggle_location_sharing(
             detail="Failed to update location sharing"
         )
     
-    return {"is_shared": request.is_shared}
+    return Response(content=_SHARING_BODY[request.is_shared], media_type="application/json")
 
 
-@router.get("/event/{event_id}")
+@router.get("/event/{event_id}", response_class=ORJSONResponse)
 async def get_event_locations(
     event_id: str,
-    current_user: User = Depends(get_current_active_user)
+    user_event_ids: Set[str] = Depends(get_user_event_ids)
 ):
     """Get current locations of all event participants who have shared their location"""
-    # Check if user is participant in event
-    user_events = await db.get_user_events(current_user.id)
-    is_participant = any(
-        event.get("id") == event_id 
-        for event in user_events
-    )
-    
-    if not is_participant:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Access denied: not a participant in this event"
-        )
-    
-    # Get event locations (only users who have shared their location)
-    locations = await db.get_event_locations(event_id)
-    
-    return locations
+    return ORJSONResponse(content=await _locations_response(event_id, user_event_ids, full_user=False))
 
 
 @router.get("/user/{user_id}")
 async def get_user_location(
     user_id: str,
-    current_user: User = Depends(get_current_active_user)
+    user_event_ids: Set[str] = Depends(get_user_event_ids)
 ):
     """Get location of a specific user (only if in same event or direct friends)"""
     # Note: This would require implementing friend relationships
     # For now, allow if users share any active events
     
-    current_user_events = await db.get_user_events(current_user.id)
-    target_user_events = await db.get_user_events(user_id)
-    
-    # Check if users share any events
-    current_event_ids = {event.get("id") for event in current_user_events}
-    target_event_ids = {event.get("id") for event in target_user_events}
-    
-    shared_events = current_event_ids.intersection(target_event_ids)
-    
-    if not shared_events:
+    # Check if users share any events (the caller's ids come with auth)
+    if not await db.shares_active_event(user_id, user_event_ids):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Access denied: no shared events with this user"
@@ -132,42 +109,55 @@ async def get_user_location(
     return {"message": "Location access granted", "user_id": user_id}
 
 
-@router.get("/event/{event_id}/latest")
+@router.get("/event/{event_id}/latest", response_class=ORJSONResponse)
 async def get_event_participants_latest_locations(
     event_id: str,
-    current_user: User = Depends(get_current_active_user)
+    user_event_ids: Set[str] = Depends(get_user_event_ids)
 ):
     """Return all active participants with their latest location (or null).
 
     Response: [{ user: User, location: UserLocation | null }]
     """
+    return ORJSONResponse(content=await _locations_response(event_id, user_event_ids, full_user=True))
+
+
+async def _locations_response(event_id: str, user_event_ids: Set[str], *, full_user: bool) -> List[Dict[str, Any]]:
+    """Shared body for the event location endpoints.
+
+    With ``full_user`` each entry carries the full participant profile and their
+    latest location; otherwise the shared current locations are returned as-is
+    (users projected to id, full_name and avatar_url).
+    """
     # Check if user is participant in event
-    user_events = await db.get_user_events(current_user.id)
-    is_participant = any(
-        event.get("id") == event_id 
-        for event in user_events
-    )
-    if not is_participant:
+    if event_id not in user_event_ids:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Access denied: not a participant in this event"
         )
 
+    if not full_user:
+        # Only users who have shared their location
+        return await db.get_event_locations(event_id)
+
     merged = await db.get_event_participants_with_latest_location(event_id)
+    return _build_latest_location_response(merged)
 
-    # Cast nested user/location into expected shapes
+
+def _build_latest_location_response(merged: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Shape merged participant rows into [{ user, location | None }].
+
+    Rows come from our own database and already have the User/UserLocation
+    columns, so both are passed through untouched for orjson to serialize.
+    """
     response: List[Dict[str, Any]] = []
+    entry: Dict[str, Any]
     for entry in merged:
-        user_data = entry.get("user") or {}
-        location_data = entry.get("location") or None
-        try:
-            user_obj = User(**user_data)
-        except Exception:
+        user_data: Optional[Dict[str, Any]] = entry.get("user")
+        if not user_data or not user_data.get("id"):
             continue
-        loc_obj = UserLocation(**location_data) if location_data else None
         response.append({
-            "user": user_obj.dict(),
-            "location": loc_obj.dict() if loc_obj else None
+            "user": user_data,
+            "location": entry.get("location") or None
         })
 
     return response
@@ -3,12 +3,15 @@ Push notification endpoints for device token management and FCM integration.
 """
 
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import Response
 from pydantic import BaseModel, Field
 from typing import Optional
 from auth import get_current_active_user
 from models import User
 from database import db
 from fcm_service import fcm_service
+from responses import ORJSONResponse
+import orjson
 
 router = APIRouter(prefix="/notifications", tags=["notifications"])
 
@@ -24,7 +27,12 @@ class NotificationResponse(BaseModel):
     message: str
 
 
-@router.post("/register-token", response_model=NotificationResponse)
+# Fixed success payloads, serialized once at import
+_REGISTERED = orjson.dumps({"success": True, "message": "Device token registered successfully"})
+_UNREGISTERED = orjson.dumps({"success": True, "message": "Device token unregistered successfully"})
+
+
+@router.post("/register-token", response_class=ORJSONResponse, responses={200: {"model": NotificationResponse}})
 async def register_device_token(
     request: DeviceTokenRequest,
     current_user: User = Depends(get_current_active_user)
@@ -39,10 +47,7 @@ async def register_device_token(
         )
         
         if success:
-            return NotificationResponse(
-                success=True,
-                message="Device token registered successfully"
-            )
+            return Response(content=_REGISTERED, media_type="application/json")
         else:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -56,7 +61,7 @@ async def register_device_token(
         )
 
 
-@router.post("/unregister-token", response_model=NotificationResponse)
+@router.post("/unregister-token", response_class=ORJSONResponse, responses={200: {"model": NotificationResponse}})
 async def unregister_device_token(
     request: DeviceTokenRequest,
     current_user: User = Depends(get_current_active_user)
@@ -69,10 +74,7 @@ async def unregister_device_token(
         )
         
         if success:
-            return NotificationResponse(
-                success=True,
-                message="Device token unregistered successfully"
-            )
+            return Response(content=_UNREGISTERED, media_type="application/json")
         else:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -1,42 +1,51 @@
-from typing import List, Optional
+from typing import Dict, List, Optional, Set, Tuple
 from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi.responses import Response
 from models import (
     EventPin, EventPinCreate, EventPinUpdate, EventPinWithCreator,
     PinType, User
 )
-from auth import get_current_active_user
+from auth import get_current_active_user, get_user_event_ids
 from database import db
+from responses import ORJSONResponse
+from routers._pins_common import merge_creator, pin_list_response, require_event_participant
+import time
 import uuid
-from datetime import datetime
+from datetime import datetime, timezone
 
 router = APIRouter(prefix="/pins", tags=["event pins"])
 
+# Event pin lists are polled heavily; serve repeats from a short-lived per-event cache
+PIN_LIST_CACHE_TTL_SECONDS = 15
+PIN_LIST_CACHE_MAX_ENTRIES = 1000
+_pin_list_cache: Dict[str, Tuple[float, bytes]] = {}  # event_id -> (monotonic expiry, serialized pins)
 
-@router.post("/", response_model=EventPin)
+# Valid pin type values and the matching error detail, built once at import
+_PIN_TYPE_VALUES = frozenset(pt.value for pt in PinType)
+_INVALID_PIN_TYPE_DETAIL = f"Invalid pin type. Must be one of: {[pt.value for pt in PinType]}"
+
+
+def _invalidate_pin_list(event_id: str):
+    """Drop the cached pin list for an event after a pin write"""
+    _pin_list_cache.pop(event_id, None)
+
+
+@router.post("/", response_class=ORJSONResponse, responses={200: {"model": EventPin}})
 async def create_event_pin(
     pin_data: EventPinCreate,
-    current_user: User = Depends(get_current_active_user)
+    current_user: User = Depends(get_current_active_user),
+    user_event_ids: Set[str] = Depends(get_user_event_ids)
 ):
     """Create a new event pin"""
     # Check if user is participant in event
-    user_events = await db.get_user_events(current_user.id)
-    is_participant = any(
-        event.get("id") == pin_data.event_id 
-        for event in user_events
-    )
-    
-    if not is_participant:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Access denied: not a participant in this event"
-        )
+    require_event_participant(pin_data.event_id, user_event_ids)
     
     # Prepare pin data
     pin_dict = pin_data.dict()
     pin_dict.update({
         "id": str(uuid.uuid4()),
         "creator_id": current_user.id,
-        "created_at": datetime.utcnow().isoformat()
+        "created_at": datetime.now(timezone.utc).isoformat()
     })
     
     # Create pin in database
@@ -46,60 +55,40 @@ async def create_event_pin(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Failed to create event pin"
         )
+    _invalidate_pin_list(pin_data.event_id)
     
-    return EventPin(**created_pin)
+    return ORJSONResponse(content=created_pin)
 
 
-@router.get("/event/{event_id}", response_model=List[EventPinWithCreator])
+@router.get("/event/{event_id}", response_class=ORJSONResponse, responses={200: {"model": List[EventPinWithCreator]}})
 async def get_event_pins(
     event_id: str,
-    current_user: User = Depends(get_current_active_user)
+    current_user: User = Depends(get_current_active_user),
+    user_event_ids: Set[str] = Depends(get_user_event_ids)
 ):
     """Get all pins for an event"""
     # Check if user is participant in event
-    user_events = await db.get_user_events(current_user.id)
-    is_participant = any(
-        event.get("id") == event_id 
-        for event in user_events
-    )
+    require_event_participant(event_id, user_event_ids)
     
-    if not is_participant:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Access denied: not a participant in this event"
-        )
+    cached = _pin_list_cache.get(event_id)
+    if cached is not None and cached[0] > time.monotonic():
+        return Response(content=cached[1], media_type="application/json")
     
     pins_data = await db.get_event_pins(event_id)
-    
-    # Convert to EventPinWithCreator objects
-    pins = []
-    for pin_data in pins_data:
-        try:
-            # Process creator data
-            creator_data = pin_data.pop("creator", {})
-            if creator_data:
-                creator_data.setdefault("role", "user")
-                creator_data.setdefault("is_active", True)
-                creator_data.setdefault("last_seen", None)
-                creator_data.setdefault("created_at", "2024-01-01T00:00:00Z")
-                creator_data.setdefault("updated_at", None)
-                pin_data["creator"] = User(**creator_data)
-            else:
-                pin_data["creator"] = None
-            
-            pins.append(EventPinWithCreator(**pin_data))
-        except Exception as e:
-            print(f"Error creating EventPinWithCreator object: {e}")
-            print(f"Pin data: {pin_data}")
-            continue
-    
-    return pins
+    response = pin_list_response(pins_data)
+    _pin_list_cache.pop(event_id, None)
+    if len(_pin_list_cache) >= PIN_LIST_CACHE_MAX_ENTRIES:
+        # Evict the least recently stored entry
+        _pin_list_cache.pop(next(iter(_pin_list_cache)))
+    _pin_list_cache[event_id] = (time.monotonic() + PIN_LIST_CACHE_TTL_SECONDS, bytes(response.body))
+    return response
 
 
-@router.get("/{pin_id}", response_model=EventPinWithCreator)
+@router.get("/{pin_id}", response_class=ORJSONResponse, responses={200: {"model": EventPinWithCreator}})
 async def get_event_pin(
     pin_id: str,
-    current_user: User = Depends(get_current_active_user)
+    current_user: User = Depends(get_current_active_user),
+    user_event_ids: Set[str] = Depends(get_user_event_ids)
 ):
     """Get a specific event pin"""
     pin_data = await db.get_event_pin(pin_id)
@@ -110,69 +99,43 @@ async def get_event_pin(
         )
     
     # Check if user is participant in the event
-    user_events = await db.get_user_events(current_user.id)
-    is_participant = any(
-        event.get("id") == pin_data["event_id"] 
-        for event in user_events
-    )
-    
-    if not is_participant:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Access denied: not a participant in this event"
-        )
-    
-    # Process creator data
-    creator_data = pin_data.pop("creator", {})
-    if creator_data:
-        creator_data.setdefault("role", "user")
-        creator_data.setdefault("is_active", True)
-        creator_data.setdefault("last_seen", None)
-        creator_data.setdefault("created_at", "2024-01-01T00:00:00Z")
-        creator_data.setdefault("updated_at", None)
-        pin_data["creator"] = User(**creator_data)
-    else:
-        pin_data["creator"] = None
+    require_event_participant(pin_data["event_id"], user_event_ids)
     
-    return EventPinWithCreator(**pin_data)
+    return ORJSONResponse(content=merge_creator(pin_data))
 
 
-@router.put("/{pin_id}", response_model=EventPin)
+@router.put("/{pin_id}", response_class=ORJSONResponse, responses={200: {"model": EventPin}})
 async def update_event_pin(
     pin_id: str,
     pin_updates: EventPinUpdate,
     current_user: User = Depends(get_current_active_user)
 ):
     """Update an event pin"""
-    # Get existing pin
-    pin_data = await db.get_event_pin(pin_id)
-    if not pin_data:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Event pin not found"
-        )
-    
-    # Check if user is the creator
-    if pin_data["creator_id"] != current_user.id:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Only the pin creator can update this pin"
-        )
-    
     # Prepare updates
     update_data = pin_updates.dict(exclude_unset=True)
     
-    # Update pin in database
-    success = await db.update_event_pin(pin_id, update_data)
-    if not success:
+    # Update pin in database (only matches when the user is the creator)
+    updated_pin = await db.update_event_pin(pin_id, update_data, creator_id=current_user.id)
+    if not updated_pin:
+        # Nothing updated: find out whether the pin is missing or owned by someone else
+        pin_data = await db.get_event_pin(pin_id)
+        if not pin_data:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Event pin not found"
+            )
+        if pin_data["creator_id"] != current_user.id:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Only the pin creator can update this pin"
+            )
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Failed to update event pin"
         )
+    _invalidate_pin_list(updated_pin["event_id"])
     
-    # Get updated pin
-    updated_pin = await db.get_event_pin(pin_id)
-    return EventPin(**updated_pin)
+    return ORJSONResponse(content=updated_pin)
 
 
 @router.delete("/{pin_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -203,70 +166,40 @@ async def delete_event_pin(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Failed to delete event pin"
         )
+    _invalidate_pin_list(pin_data["event_id"])
 
 
-@router.get("/event/{event_id}/type/{pin_type}", response_model=List[EventPinWithCreator])
+@router.get("/event/{event_id}/type/{pin_type}", response_class=ORJSONResponse, responses={200: {"model": List[EventPinWithCreator]}})
 async def get_pins_by_type(
     event_id: str,
     pin_type: str,
-    current_user: User = Depends(get_current_active_user)
+    current_user: User = Depends(get_current_active_user),
+    user_event_ids: Set[str] = Depends(get_user_event_ids)
 ):
     """Get pins of a specific type for an event"""
     # Validate pin type
-    if pin_type not in [pt.value for pt in PinType]:
+    if pin_type not in _PIN_TYPE_VALUES:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Invalid pin type. Must be one of: {[pt.value for pt in PinType]}"
+            detail=_INVALID_PIN_TYPE_DETAIL
         )
     
     # Check if user is participant in event
-    user_events = await db.get_user_events(current_user.id)
-    is_participant = any(
-        event.get("id") == event_id 
-        for event in user_events
-    )
-    
-    if not is_participant:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Access denied: not a participant in this event"
-        )
+    require_event_participant(event_id, user_event_ids)
     
     pins_data = await db.get_pins_by_type(event_id, pin_type)
-    
-    # Convert to EventPinWithCreator objects
-    pins = []
-    for pin_data in pins_data:
-        try:
-            # Process creator data
-            creator_data = pin_data.pop("creator", {})
-            if creator_data:
-                creator_data.setdefault("role", "user")
-                creator_data.setdefault("is_active", True)
-                creator_data.setdefault("last_seen", None)
-                creator_data.setdefault("created_at", "2024-01-01T00:00:00Z")
-                creator_data.setdefault("updated_at", None)
-                pin_data["creator"] = User(**creator_data)
-            else:
-                pin_data["creator"] = None
-            
-            pins.append(EventPinWithCreator(**pin_data))
-        except Exception as e:
-            print(f"Error creating EventPinWithCreator object: {e}")
-            print(f"Pin data: {pin_data}")
-            continue
-    
-    return pins
+    return pin_list_response(pins_data)
 
 
-@router.get("/event/{event_id}/bounds", response_model=List[EventPinWithCreator])
+@router.get("/event/{event_id}/bounds", response_class=ORJSONResponse, responses={200: {"model": List[EventPinWithCreator]}})
 async def get_pins_in_bounds(
     event_id: str,
     north: float = Query(..., description="Northern boundary latitude"),
     south: float = Query(..., description="Southern boundary latitude"),
     east: float = Query(..., description="Eastern boundary longitude"),
     west: float = Query(..., description="Western boundary longitude"),
-    current_user: User = Depends(get_current_active_user)
+    current_user: User = Depends(get_current_active_user),
+    user_event_ids: Set[str] = Depends(get_user_event_ids)
 ):
     """Get pins within geographic bounds for an event"""
     # Validate bounds
@@ -282,40 +215,7 @@ async def get_pins_in_bounds(
         )
     
     # Check if user is participant in event
-    user_events = await db.get_user_events(current_user.id)
-    is_participant = any(
-        event.get("id") == event_id 
-        for event in user_events
-    )
-    
-    if not is_participant:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Access denied: not a participant in this event"
-        )
+    require_event_participant(event_id, user_event_ids)
     
     pins_data = await db.get_pins_in_bounds(event_id, north, south, east, west)
-    
-    # Convert to EventPinWithCreator objects
-    pins = []
-    for pin_data in pins_data:
-        try:
-            # Process creator data
-            creator_data = pin_data.pop("creator", {})
-            if creator_data:
-                creator_data.setdefault("role", "user")
-                creator_data.setdefault("is_active", True)
-                creator_data.setdefault("last_seen", None)
-                creator_data.setdefault("created_at", "2024-01-01T00:00:00Z")
-                creator_data.setdefault("updated_at", None)
-                pin_data["creator"] = User(**creator_data)
-            else:
-                pin_data["creator"] = None
-            
-            pins.append(EventPinWithCreator(**pin_data))
-        except Exception as e:
-            print(f"Error creating EventPinWithCreator object: {e}")
-            print(f"Pin data: {pin_data}")
-            continue
-    
-    return pins
+    return pin_list_response(pins_data)
@@ -54,7 +54,8 @@ async def get_user_by_id(
     current_user: User = Depends(get_current_active_user)
 ):
     """Get a user's profile by their ID"""
-    user_data = await db.get_user_profile(user_id)
+    # Profiles of other users can be a few seconds stale; use the cached bulk read
+    user_data = (await db.get_user_profiles_bulk([user_id])).get(user_id)
     if not user_data:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -1,14 +1,26 @@
-from typing import List, Optional, Dict, Any
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Union
 from fastapi import APIRouter, Depends, HTTPException, status, WebSocket, WebSocketDisconnect
 from models import VideoCall, VideoCallCreate, User
-from auth import get_current_active_user
+from auth import get_current_active_user, get_user_event_ids
 from database import db
 from fcm_service import fcm_service
+from config import settings
+from responses import dumps_text
+from redis import asyncio as aioredis
 import uuid
-from datetime import datetime
-import json
+from datetime import datetime, timezone
+import asyncio
+import logging
+import msgspec
+import orjson
 
 router = APIRouter(prefix="/video", tags=["video-chat"])
+logger = logging.getLogger(__name__)
+
+# Cross-worker participant sets expire if a worker dies without cleaning up
+CALL_PARTICIPANTS_TTL_SECONDS = 6 * 60 * 60
+# Pause before resubscribing after a call's Redis listener fails
+LISTENER_RETRY_SECONDS = 1
 
 
 async def send_video_call_notifications(created_call: dict, caller: User):
@@ -29,49 +41,150 @@ async def send_video_call_notifications(created_call: dict, caller: User):
                     event_id=event_id
                 )
     except Exception as e:
-        print(f"Error sending video call notifications: {e}")
+        logger.error("Error sending video call notifications: %s", e)
 
 
 class VideoConnectionManager:
+    """Tracks signaling sockets per call.
+
+    Without ``settings.redis_url`` every frame is delivered in process. With it,
+    sends are published on a per-call Redis channel and each worker forwards
+    them to the sockets it holds locally, so participants may sit on different
+    workers or hosts.
+    """
     def __init__(self):
-        self.active_connections: Dict[str, WebSocket] = {}  # call_id -> websocket
-        self.call_participants: Dict[str, List[str]] = {}  # call_id -> [user_ids]
+        self.active_connections: Dict[str, Dict[str, WebSocket]] = {}  # call_id -> {user_id: websocket}
+        self.call_participants: Dict[str, Set[str]] = {}  # call_id -> {user_ids} connected to this worker
         self.user_calls: Dict[str, str] = {}  # user_id -> call_id
+        self.redis = aioredis.from_url(settings.redis_url) if settings.redis_url else None
+        self.call_listeners: Dict[str, asyncio.Task] = {}  # call_id -> task forwarding Redis frames locally
+        self.listener_lock: Optional[asyncio.Lock] = None  # serializes listener setup so each call subscribes once per worker
+        self.pending: Set[asyncio.Task] = set()  # fire-and-forget Redis cleanups
     
     async def connect(self, websocket: WebSocket, call_id: str, user_id: str):
         await websocket.accept()
         
-        if call_id not in self.active_connections:
-            self.active_connections[call_id] = {}
-        if call_id not in self.call_participants:
-            self.call_participants[call_id] = []
-            
-        self.active_connections[call_id][user_id] = websocket
-        if user_id not in self.call_participants[call_id]:
-            self.call_participants[call_id].append(user_id)
+        self.active_connections.setdefault(call_id, {})[user_id] = websocket
+        self.call_participants.setdefault(call_id, set()).add(user_id)
         self.user_calls[user_id] = call_id
+        
+        if self.redis is not None:
+            key = f"video:participants:{call_id}"
+            await self.redis.sadd(key, user_id)
+            await self.redis.expire(key, CALL_PARTICIPANTS_TTL_SECONDS)
+            if self.listener_lock is None:
+                # Created on first use so it binds to the serving loop, not the import-time one (3.9)
+                self.listener_lock = asyncio.Lock()
+            async with self.listener_lock:
+                if call_id not in self.call_listeners:
+                    # Subscribe before returning so frames sent right after the join aren't missed
+                    pubsub = self.redis.pubsub()
+                    await pubsub.subscribe(f"video:call:{call_id}")
+                    if call_id in self.active_connections:
+                        self.call_listeners[call_id] = asyncio.create_task(self._listen(call_id, pubsub))
+                    else:
+                        # Every local socket left while we were subscribing
+                        await pubsub.aclose()
     
     def disconnect(self, call_id: str, user_id: str):
-        if call_id in self.active_connections and user_id in self.active_connections[call_id]:
-            del self.active_connections[call_id][user_id]
+        connections = self.active_connections.get(call_id)
+        if connections is not None:
+            connections.pop(user_id, None)
+            if not connections:
+                del self.active_connections[call_id]
+        
+        participants = self.call_participants.get(call_id)
+        if participants is not None:
+            participants.discard(user_id)
+            if not participants:
+                del self.call_participants[call_id]
         
-        if call_id in self.call_participants and user_id in self.call_participants[call_id]:
-            self.call_participants[call_id].remove(user_id)
+        self.user_calls.pop(user_id, None)
         
-        if user_id in self.user_calls:
-            del self.user_calls[user_id]
+        if self.redis is not None:
+            task = asyncio.create_task(self.redis.srem(f"video:participants:{call_id}", user_id))
+            self.pending.add(task)
+            task.add_done_callback(self.pending.discard)
+            if call_id not in self.active_connections:
+                listener = self.call_listeners.pop(call_id, None)
+                if listener is not None:
+                    listener.cancel()
+    
+    async def get_participants(self, call_id: str) -> List[str]:
+        """User ids connected to the call (across all workers when Redis is configured)"""
+        if self.redis is not None:
+            # Let queued removals from disconnect() land first
+            if self.pending:
+                await asyncio.gather(*self.pending, return_exceptions=True)
+            return [member.decode() for member in await self.redis.smembers(f"video:participants:{call_id}")]
+        return list(self.call_participants.get(call_id, ()))
     
     async def send_to_call(self, call_id: str, message: str, exclude_user: str = None):
-        if call_id in self.active_connections:
-            for user_id, websocket in self.active_connections[call_id].items():
-                if user_id != exclude_user:
-                    try:
-                        await websocket.send_text(message)
-                    except:
-                        # Connection might be closed
-                        pass
+        if self.redis is not None:
+            await self._publish(call_id, message, exclude_user=exclude_user)
+        else:
+            await self._deliver_to_call(call_id, message, exclude_user)
     
     async def send_to_user(self, call_id: str, user_id: str, message: str):
+        if self.redis is not None:
+            await self._publish(call_id, message, target_user=user_id)
+        else:
+            await self._deliver_to_user(call_id, user_id, message)
+    
+    async def _publish(self, call_id: str, message: str, exclude_user: Optional[str] = None, target_user: Optional[str] = None):
+        await self.redis.publish(f"video:call:{call_id}", orjson.dumps({
+            "message": message,
+            "exclude_user": exclude_user,
+            "target_user": target_user
+        }))
+    
+    async def _listen(self, call_id: str, pubsub):
+        """Forward frames published for a call to this worker's sockets.
+
+        Runs until disconnect() cancels it; if Redis fails, the channel is
+        resubscribed on a fresh connection.
+        """
+        while True:
+            try:
+                if pubsub is None:
+                    pubsub = self.redis.pubsub()
+                    await pubsub.subscribe(f"video:call:{call_id}")
+                async for item in pubsub.listen():
+                    if item["type"] != "message":
+                        continue
+                    envelope = orjson.loads(item["data"])
+                    if envelope["target_user"]:
+                        await self._deliver_to_user(call_id, envelope["target_user"], envelope["message"])
+                    else:
+                        await self._deliver_to_call(call_id, envelope["message"], envelope["exclude_user"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Video signaling listener for call %s failed, resubscribing: %s", call_id, e)
+            finally:
+                if pubsub is not None:
+                    await pubsub.aclose()
+                    pubsub = None
+            await asyncio.sleep(LISTENER_RETRY_SECONDS)
+    
+    async def _deliver_to_call(self, call_id: str, message: str, exclude_user: Optional[str] = None):
+        connections = self.active_connections.get(call_id)
+        if not connections:
+            return
+        
+        # Send to everyone concurrently so one slow client doesn't stall the rest
+        targets = [(user_id, websocket) for user_id, websocket in connections.items() if user_id != exclude_user]
+        results = await asyncio.gather(
+            *(websocket.send_text(message) for _, websocket in targets),
+            return_exceptions=True
+        )
+        
+        # Evict connections that failed (closed or broken), unless the user has since reconnected
+        for (user_id, websocket), result in zip(targets, results):
+            if isinstance(result, Exception) and connections.get(user_id) is websocket:
+                self.disconnect(call_id, user_id)
+    
+    async def _deliver_to_user(self, call_id: str, user_id: str, message: str):
         if call_id in self.active_connections and user_id in self.active_connections[call_id]:
             try:
                 await self.active_connections[call_id][user_id].send_text(message)
@@ -90,10 +203,10 @@ async def video_websocket_endpoint(websocket: WebSocket, call_id: str, user_id:
     # Notify other participants that user joined
     await video_manager.send_to_call(
         call_id,
-        json.dumps({
+        dumps_text({
             "type": "user_joined",
             "user_id": user_id,
-            "participants": video_manager.call_participants.get(call_id, [])
+            "participants": await video_manager.get_participants(call_id)
         }),
         exclude_user=user_id
     )
@@ -108,87 +221,131 @@ async def video_websocket_endpoint(websocket: WebSocket, call_id: str, user_id:
         # Notify other participants that user left
         await video_manager.send_to_call(
             call_id,
-            json.dumps({
+            dumps_text({
                 "type": "user_left",
                 "user_id": user_id,
-                "participants": video_manager.call_participants.get(call_id, [])
+                "participants": await video_manager.get_participants(call_id)
+            })
+        )
+
+
+# Inbound signaling frames, decoded and validated by msgspec on their "type" tag
+class Offer(msgspec.Struct, tag_field="type", tag="offer"):
+    offer: Any = None
+    target_user: Optional[str] = None
+
+
+class Answer(msgspec.Struct, tag_field="type", tag="answer"):
+    answer: Any = None
+    target_user: Optional[str] = None
+
+
+class IceCandidate(msgspec.Struct, tag_field="type", tag="ice_candidate"):
+    candidate: Any = None
+    target_user: Optional[str] = None
+
+
+class Mute(msgspec.Struct, tag_field="type", tag="mute"):
+    pass
+
+
+class Unmute(msgspec.Struct, tag_field="type", tag="unmute"):
+    pass
+
+
+class VideoToggle(msgspec.Struct, tag_field="type", tag="video_toggle"):
+    video_enabled: bool = True
+
+
+Signal = Union[Offer, Answer, IceCandidate, Mute, Unmute, VideoToggle]
+_SIGNAL_DECODER = msgspec.json.Decoder(Signal)
+
+
+async def _forward_offer(signal: Offer, call_id: str, sender_id: str):
+    """Forward offer to specific participant"""
+    if signal.target_user:
+        await video_manager.send_to_user(
+            call_id,
+            signal.target_user,
+            dumps_text({
+                "type": "offer",
+                "offer": signal.offer,
+                "from_user": sender_id
+            })
+        )
+
+
+async def _forward_answer(signal: Answer, call_id: str, sender_id: str):
+    """Forward answer to specific participant"""
+    if signal.target_user:
+        await video_manager.send_to_user(
+            call_id,
+            signal.target_user,
+            dumps_text({
+                "type": "answer",
+                "answer": signal.answer,
+                "from_user": sender_id
             })
         )
 
 
+async def _forward_ice_candidate(signal: IceCandidate, call_id: str, sender_id: str):
+    """Forward ICE candidate to specific participant or all"""
+    ice_message = dumps_text({
+        "type": "ice_candidate",
+        "candidate": signal.candidate,
+        "from_user": sender_id
+    })
+    
+    if signal.target_user:
+        await video_manager.send_to_user(call_id, signal.target_user, ice_message)
+    else:
+        await video_manager.send_to_call(call_id, ice_message, exclude_user=sender_id)
+
+
+async def _notify_mute(signal: Union[Mute, Unmute], call_id: str, sender_id: str):
+    """Notify other participants about mute/unmute"""
+    await video_manager.send_to_call(
+        call_id,
+        dumps_text({
+            "type": "mute" if isinstance(signal, Mute) else "unmute",
+            "user_id": sender_id
+        }),
+        exclude_user=sender_id
+    )
+
+
+async def _notify_video_toggle(signal: VideoToggle, call_id: str, sender_id: str):
+    """Notify other participants about video on/off"""
+    await video_manager.send_to_call(
+        call_id,
+        dumps_text({
+            "type": "video_toggle",
+            "user_id": sender_id,
+            "video_enabled": signal.video_enabled
+        }),
+        exclude_user=sender_id
+    )
+
+
+_SIGNAL_HANDLERS: Dict[type, Callable[[Any, str, str], Awaitable[None]]] = {
+    Offer: _forward_offer,
+    Answer: _forward_answer,
+    IceCandidate: _forward_ice_candidate,
+    Mute: _notify_mute,
+    Unmute: _notify_mute,
+    VideoToggle: _notify_video_toggle,
+}
+
+
 async def handle_video_message(data: str, call_id: str, sender_id: str):
     """Handle WebRTC signaling messages"""
     try:
-        message = json.loads(data)
-        message_type = message.get("type")
-        
-        if message_type == "offer":
-            # Forward offer to specific participant
-            target_user = message.get("target_user")
-            if target_user:
-                await video_manager.send_to_user(
-                    call_id,
-                    target_user,
-                    json.dumps({
-                        "type": "offer",
-                        "offer": message.get("offer"),
-                        "from_user": sender_id
-                    })
-                )
-        
-        elif message_type == "answer":
-            # Forward answer to specific participant
-            target_user = message.get("target_user")
-            if target_user:
-                await video_manager.send_to_user(
-                    call_id,
-                    target_user,
-                    json.dumps({
-                        "type": "answer",
-                        "answer": message.get("answer"),
-                        "from_user": sender_id
-                    })
-                )
-        
-        elif message_type == "ice_candidate":
-            # Forward ICE candidate to specific participant or all
-            target_user = message.get("target_user")
-            ice_message = json.dumps({
-                "type": "ice_candidate",
-                "candidate": message.get("candidate"),
-                "from_user": sender_id
-            })
-            
-            if target_user:
-                await video_manager.send_to_user(call_id, target_user, ice_message)
-            else:
-                await video_manager.send_to_call(call_id, ice_message, exclude_user=sender_id)
-        
-        elif message_type == "mute" or message_type == "unmute":
-            # Notify other participants about mute/unmute
-            await video_manager.send_to_call(
-                call_id,
-                json.dumps({
-                    "type": message_type,
-                    "user_id": sender_id
-                }),
-                exclude_user=sender_id
-            )
-        
-        elif message_type == "video_toggle":
-            # Notify other participants about video on/off
-            await video_manager.send_to_call(
-                call_id,
-                json.dumps({
-                    "type": "video_toggle",
-                    "user_id": sender_id,
-                    "video_enabled": message.get("video_enabled", True)
-                }),
-                exclude_user=sender_id
-            )
+        signal = _SIGNAL_DECODER.decode(data)
+    except msgspec.DecodeError:
+        return  # Invalid JSON, unknown type or malformed fields; ignore
     
-    except json.JSONDecodeError:
-        pass  # Invalid JSON, ignore
+    await _SIGNAL_HANDLERS[type(signal)](signal, call_id, sender_id)
 
 
 @router.post("/", response_model=VideoCall)
@@ -199,14 +356,15 @@ async def create_video_call(
     """Create a new direct video call (not event-based)"""
     # For direct calls, validate participants
     if call_data.participants:
-        for participant_id in call_data.participants:
-            # Check if participant exists
-            participant = await db.get_user_profile(participant_id)
-            if not participant:
-                raise HTTPException(
-                    status_code=status.HTTP_404_NOT_FOUND,
-                    detail=f"Participant {participant_id} not found"
-                )
+        # Check all participants exist in one id-only query
+        existing_ids = await db.get_existing_user_ids(call_data.participants)
+        missing = [pid for pid in call_data.participants if pid not in existing_ids]
+        if missing:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Participant {missing[0]} not found" if len(missing) == 1
+                else f"Participants not found: {', '.join(missing)}"
+            )
     
     # Create video call record
     call_dict = call_data.dict()
@@ -214,7 +372,7 @@ async def create_video_call(
         "id": str(uuid.uuid4()),
         "creator_id": current_user.id,
         "is_active": True,
-        "started_at": datetime.utcnow().isoformat()
+        "started_at": datetime.now(timezone.utc).isoformat()
     })
     
     # Add creator to participants if not already included
@@ -267,7 +425,8 @@ async def join_video_call(
     current_user: User = Depends(get_current_active_user)
 ):
     """Join an existing video call"""
-    call_data = await db.get_video_call(call_id)
+    # Add user to participants (if active and not already there) in one atomic update
+    call_data = await db.join_video_call(call_id, current_user.id)
     if not call_data:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -280,12 +439,6 @@ async def join_video_call(
             detail="Video call is not active"
         )
     
-    # Add user to participants if not already there
-    participants = call_data.get("participants", [])
-    if current_user.id not in participants:
-        participants.append(current_user.id)
-        await db.update_video_call(call_id, {"participants": participants})
-    
     return {"message": "Joined video call", "call_id": call_id}
 
 
@@ -295,19 +448,14 @@ async def leave_video_call(
     current_user: User = Depends(get_current_active_user)
 ):
     """Leave a video call"""
-    call_data = await db.get_video_call(call_id)
+    # Remove user from participants in one atomic update
+    call_data = await db.leave_video_call(call_id, current_user.id)
     if not call_data:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Video call not found"
         )
     
-    # Remove user from participants
-    participants = call_data.get("participants", [])
-    if current_user.id in participants:
-        participants.remove(current_user.id)
-        await db.update_video_call(call_id, {"participants": participants})
-    
     # Remove user from active call
     if current_user.id in video_manager.user_calls:
         current_call_id = video_manager.user_calls[current_user.id]
@@ -323,30 +471,25 @@ async def end_video_call(
     current_user: User = Depends(get_current_active_user)
 ):
     """End a video call (only creator can end)"""
-    call_data = await db.get_video_call(call_id)
-    if not call_data:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Video call not found"
-        )
-    
-    # Check if user is creator
-    if call_data["creator_id"] != current_user.id:
+    # Mark call as inactive and set end time (only matches when the user is the creator)
+    ended_call = await db.end_video_call(call_id, current_user.id)
+    if not ended_call:
+        # Nothing updated: find out whether the call is missing or owned by someone else
+        call_data = await db.get_video_call(call_id)
+        if not call_data:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Video call not found"
+            )
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Only the call creator can end the call"
         )
     
-    # Mark call as inactive and set end time
-    await db.update_video_call(call_id, {
-        "is_active": False,
-        "ended_at": datetime.utcnow().isoformat()
-    })
-    
     # Notify all participants that call ended
     await video_manager.send_to_call(
         call_id,
-        json.dumps({
+        dumps_text({
             "type": "call_ended",
             "ended_by": current_user.id
         })
@@ -372,15 +515,12 @@ async def get_active_calls(
 @router.get("/event/{event_id}", response_model=VideoCall)
 async def get_event_video_call(
     event_id: str,
-    current_user: User = Depends(get_current_active_user)
+    current_user: User = Depends(get_current_active_user),
+    user_event_ids: Set[str] = Depends(get_user_event_ids)
 ):
     """Get or create the video call for a specific event (on-demand)"""
     # Check if user is participant in event
-    user_events = await db.get_user_events(current_user.id)
-    is_participant = any(
-        event.get("id") == event_id 
-        for event in user_events
-    )
+    is_participant = event_id in user_event_ids
     
     if not is_participant:
         raise HTTPException(
@@ -409,7 +549,7 @@ async def get_event_video_call(
                 "participants": [current_user.id],
                 "is_group_call": True,
                 "is_active": True,
-                "started_at": datetime.utcnow().isoformat()
+                "started_at": datetime.now(timezone.utc).isoformat()
             }
             
             created_call = await db.create_video_call(video_call_data)
@@ -424,7 +564,7 @@ async def get_event_video_call(
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error fetching/creating event video call: {e}")
+        logger.error("Error fetching/creating event video call: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to fetch/create event video call"
@@ -457,9 +597,10 @@ async def get_call_participants(
     # Get participant details
     participants = call_data.get("participants", [])
     participant_details = []
+    profiles = await db.get_user_profiles_bulk(participants)
     
     for user_id in participants:
-        user_data = await db.get_user_profile(user_id)
+        user_data = profiles.get(user_id)
         if user_data:
             participant_details.append({
                 "id": user_data["id"],
@@ -522,7 +663,7 @@ async def remove_participant_from_call(
             try:
                 video_manager.disconnect(call_id, user_id)
             except Exception as e:
-                print(f"Error disconnecting user from WebSocket: {e}")
+                logger.warning("Error disconnecting user from WebSocket: %s", e)
             
             return {
                 "success": True,
@@ -537,7 +678,7 @@ async def remove_participant_from_call(
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error removing participant from video call: {e}")
+        logger.error("Error removing participant from video call: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to remove participant from video call"
@@ -24,12 +24,21 @@ def main():
     print(f"📡 Server will be available at: http://localhost:8000")
     print(f"📚 API Documentation: http://localhost:8000/docs")
     
+    # The messaging connection manager and the small read caches live in process
+    # memory, so event chat only reaches sockets on the same worker. REDIS_URL
+    # relays video signaling only; keep WEB_CONCURRENCY at 1 while messaging
+    # is per process.
+    workers = 1 if settings.debug else int(os.getenv("WEB_CONCURRENCY", "1"))
+    
     try:
         uvicorn.run(
             "main:app",
             host="0.0.0.0",
             port=8000,
             reload=settings.debug,
+            workers=workers,
+            loop="auto" if settings.debug else "uvloop",
+            http="auto" if settings.debug else "httptools",
             log_level="info" if settings.debug else "warning",
             access_log=settings.debug
         )